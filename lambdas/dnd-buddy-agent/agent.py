@@ -528,16 +528,19 @@ def main(input_data: Dict[str, Any], stream_callback: Optional[Callable] = None)
         logger.error("Missing required parameters")
         return {'error': 'Missing required parameters: userId, campaign, prompt'}
     
-    # Security: validate session ownership
+    # Security: validate session ownership (id prefix, then the stored owner while loading history)
     if not session_id.startswith(f"{user_id}-"):
         logger.error(f"Session validation failed: '{session_id}' doesn't belong to '{user_id}'")
         return {'error': 'Invalid session: session does not belong to the authenticated user'}
+    
+    try:
+        history_messages = get_history_messages(session_id, message_count=2, user_id=user_id)
+    except PermissionError:
+        logger.error(f"Session validation failed: '{session_id}' is owned by another user, not '{user_id}'")
+        return {'error': 'Invalid session: session does not belong to the authenticated user'}
+    logger.info(f"Loaded {len(history_messages)} messages from history")
 
     try:
-        # Load conversation history
-        history_messages = get_history_messages(session_id, message_count=2)
-        logger.info(f"Loaded {len(history_messages)} messages from history")
-        
         # Load campaign context
         campaign_context = load_campaign_context(user_id, campaign)
         recent_sessions = load_recent_sessions(user_id, campaign)
@@ -596,6 +599,7 @@ def main(input_data: Dict[str, Any], stream_callback: Optional[Callable] = None)
         # Save to history (without tools summary)
         save_messages(
             session_id=session_id,
+            user_id=user_id,
             user_message=user_message,
             ai_message=response_text.replace(tools_summary, "").strip() if tools_summary else response_text
         )
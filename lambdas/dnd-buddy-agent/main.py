@@ -2,10 +2,12 @@
 Lambda handler for D&D Buddy agent.
 Handles WebSocket API Gateway requests for real-time agent communication.
 """
-import json
 import logging
+import operator
 import os
 import boto3
+import orjson
+from botocore.config import Config
 from agent import main as agent_main
 
 # Configure logging
@@ -17,23 +19,30 @@ WEBSOCKET_API_ENDPOINT = os.environ.get('WEBSOCKET_API_ENDPOINT')
 if not WEBSOCKET_API_ENDPOINT:
     raise ValueError("WEBSOCKET_API_ENDPOINT environment variable is required")
 
+# Streaming sends many small POSTs over the same connection: keep it alive.
+# botocore builds on urllib3's default socket options, which already set TCP_NODELAY.
 apigw_management = boto3.client(
     'apigatewaymanagementapi',
-    endpoint_url=WEBSOCKET_API_ENDPOINT
+    endpoint_url=WEBSOCKET_API_ENDPOINT,
+    config=Config(tcp_keepalive=True)
 )
 
+# Extracts the required chat fields from the message body in one call
+_get_chat_fields = operator.itemgetter('action', 'campaign', 'message', 'sessionId')
+
 
 def send_websocket_message(connection_id, message_type, content):
     """Send a message to a WebSocket client."""
     try:
-        message = json.dumps({
+        # orjson already yields UTF-8 bytes, so no separate encode step is needed
+        message = orjson.dumps({
             'type': message_type,
             'content': content
         })
         
         apigw_management.post_to_connection(
             ConnectionId=connection_id,
-            Data=message.encode('utf-8')
+            Data=message
         )
         
         logger.info(f"WebSocket message sent successfully")
@@ -55,9 +64,11 @@ def lambda_handler(event, context):
     Main Lambda handler for D&D Buddy agent.
     Handles WebSocket API Gateway requests for real-time agent communication.
     """
-    logger.info(f"Agent request: {json.dumps(event)}")
+    request_context = event.get('requestContext', {})
+    connection_id = request_context.get('connectionId')
     
-    connection_id = event.get('requestContext', {}).get('connectionId')
+    # Log only the routing fields; dumping the whole event costs CPU and log bytes
+    logger.info(f"Agent request: connectionId={connection_id}, routeKey={request_context.get('routeKey')}")
     
     if not connection_id:
         logger.error("No connection ID in WebSocket event")
@@ -65,16 +76,17 @@ def lambda_handler(event, context):
     
     try:
         # Parse message body
-        body = json.loads(event.get('body', '{}'))
+        body = orjson.loads(event.get('body') or '{}')
         
         # Extract userId from authorizer context
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('userId')
+        user_id = request_context.get('authorizer', {}).get('userId')
         
         # Extract parameters
-        action = body.get('action')
-        campaign = body.get('campaign')
-        message = body.get('message')
-        session_id = body.get('sessionId')
+        try:
+            action, campaign, message, session_id = _get_chat_fields(body)
+        except (KeyError, TypeError):
+            send_websocket_message(connection_id, 'error', 'Missing required fields')
+            return {'statusCode': 400}
         
         logger.info(f"WebSocket - Action: {action}, User: {user_id}, Campaign: {campaign}")
         
@@ -82,7 +94,7 @@ def lambda_handler(event, context):
             send_websocket_message(connection_id, 'error', f'Unknown action: {action}')
             return {'statusCode': 400}
         
-        if not all([user_id, campaign, message, session_id]):
+        if not (user_id and campaign and message and session_id):
             send_websocket_message(connection_id, 'error', 'Missing required fields')
             return {'statusCode': 400}
         
@@ -0,0 +1,63 @@
+"""
+Shared query embedding helper with caching (per Lambda execution).
+
+search_campaign and search_dnd_rules use the same model, so a query embedded
+by one tool is reused by the other and across warm invocations.
+"""
+import os
+import time
+import logging
+from functools import lru_cache
+from typing import Tuple
+import boto3
+import orjson
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Keep-alive connection pool sized for concurrent calls, with adaptive retries
+# (shared by the search tools' s3vectors clients)
+client_config = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+)
+
+# Initialize client
+bedrock_runtime = boto3.client('bedrock-runtime', config=client_config)
+
+# Environment variables
+EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'cohere.embed-english-v3')
+EMBEDDING_CACHE_TTL_SECONDS = int(os.environ.get('EMBEDDING_CACHE_TTL_SECONDS', '3600'))
+
+
+@lru_cache(maxsize=512)
+def _embed_query_cached(query: str, ttl_bucket: int) -> Tuple[float, ...]:
+    # ttl_bucket only varies the cache key so entries expire after the TTL
+    response = bedrock_runtime.invoke_model(
+        modelId=EMBEDDING_MODEL_ID,
+        contentType="application/json",
+        accept="application/json",
+        body=orjson.dumps({
+            "texts": [query],
+            "input_type": "search_query",
+            "truncate": "END"
+        })
+    )
+
+    result = orjson.loads(response['body'].read())
+    return tuple(result.get('embeddings', [[]])[0])
+
+
+def embed_query(query: str) -> Tuple[float, ...]:
+    """
+    Generate a search query embedding using Bedrock Cohere.
+
+    Args:
+        query: The search query text
+
+    Returns:
+        Embedding as a tuple of floats (empty if generation failed)
+    """
+    return _embed_query_cached(query, int(time.time() // EMBEDDING_CACHE_TTL_SECONDS))
@@ -3,10 +3,13 @@ Conversation history retrieval tool with caching.
 """
 import logging
 import os
-from typing import Optional, List
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Optional, List
+import boto3
 from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.chat_message_histories import DynamoDBChatMessageHistory
+from langchain_core.messages import HumanMessage, AIMessage, messages_from_dict, messages_to_dict
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -17,85 +20,148 @@ CHAT_HISTORY_TABLE_NAME = os.environ.get('CHAT_HISTORY_TABLE_NAME', 'dnd-buddy-c
 # TTL configuration: 7 days in seconds
 TTL_SECONDS = 7 * 24 * 60 * 60  # 604,800 seconds
 
-# Global cache for conversation history (per Lambda execution)
-_history_cache = {}
+# Maximum number of messages kept in memory per cached session
+MAX_CACHED_MESSAGES = 200
+
+# Leading characters of the last AI message stored for session list previews
+PREVIEW_SOURCE_CHARS = 2000
+
+# Chat history table
+chat_history_table = boto3.resource('dynamodb').Table(CHAT_HISTORY_TABLE_NAME)
+
+# Global cache for conversation history (per Lambda execution):
+# session_id -> {'messages': deque of cleaned messages, 'count': stored message count,
+#                'owner': stored UserId or None}
+_history_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def _clean_human(msg: HumanMessage) -> Optional[HumanMessage]:
+    # Reuse messages that carry no metadata instead of reallocating them
+    if msg.additional_kwargs or msg.response_metadata or msg.id or msg.name:
+        return HumanMessage(content=msg.content)
+    return msg
+
+
+def _clean_ai(msg: AIMessage) -> Optional[AIMessage]:
+    # Skip tool calls - only keep final responses
+    if getattr(msg, 'tool_calls', None):
+        return None
+    return AIMessage(content=msg.content)
+
+
+def _drop(msg) -> None:
+    return None
+
+
+# Exact-class dispatch for history cleaning (other message types are dropped)
+_CLEANERS = {
+    HumanMessage: _clean_human,
+    AIMessage: _clean_ai,
+}
 
 
 def clean_history_messages(messages: List) -> List:
     """Strip unnecessary metadata from history messages."""
-    cleaned = []
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            cleaned.append(HumanMessage(content=msg.content))
-        elif isinstance(msg, AIMessage):
-            # Skip tool calls - only keep final responses
-            if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                continue
-            cleaned.append(AIMessage(content=msg.content))
-    return cleaned
-
-
-def load_history(session_id: str) -> List:
+    get_cleaner = _CLEANERS.get
+    cleaned = (get_cleaner(msg.__class__, _drop)(msg) for msg in messages)
+    return [msg for msg in cleaned if msg is not None]
+
+
+def tail_messages(messages: deque, message_count: int) -> List:
+    """Return the last message_count messages without copying the whole history."""
+    total = len(messages)
+    return list(islice(messages, max(0, total - message_count), total))
+
+
+def _load_session(session_id: str) -> Dict[str, Any]:
     """
-    Load conversation history from DynamoDB with caching.
+    Return the cache entry for a session, loading it from DynamoDB if needed.
     
-    Args:
-        session_id: Session ID
-        
-    Returns:
-        List of cleaned messages
+    A session can be continued on any container, so a cached entry is only
+    reused while the stored MessageCount still matches it.
     """
-    # Check cache first
-    if session_id in _history_cache:
-        logger.info(f"Using cached history for session {session_id}")
-        return _history_cache[session_id]
-    
-    logger.info(f"Loading history from DynamoDB for session {session_id}")
+    cached = _history_cache.get(session_id)
     
     try:
-        # Initialize chat history
-        chat_history = DynamoDBChatMessageHistory(
-            table_name=CHAT_HISTORY_TABLE_NAME,
-            session_id=session_id,
-            primary_key_name='SessionId'
-        )
+        if cached is not None:
+            item = chat_history_table.get_item(
+                Key={'SessionId': session_id},
+                ProjectionExpression='MessageCount, UserId',
+                ConsistentRead=True
+            ).get('Item', {})
+            # Items without MessageCount have not been written since it was introduced
+            if item.get('MessageCount', cached['count']) == cached['count'] and item.get('UserId') == cached['owner']:
+                logger.info(f"Using cached history for session {session_id}")
+                return cached
+            logger.info(f"Cached history for session {session_id} is stale, reloading")
         
-        # Get all messages
-        all_messages = chat_history.messages
-        all_messages = clean_history_messages(all_messages)
+        logger.info(f"Loading history from DynamoDB for session {session_id}")
+        item = chat_history_table.get_item(
+            Key={'SessionId': session_id},
+            ProjectionExpression='History, UserId',
+            ConsistentRead=True
+        ).get('Item', {})
+        history = item.get('History', [])
         
         # Cache the result
-        _history_cache[session_id] = all_messages
+        entry = {
+            'messages': deque(clean_history_messages(messages_from_dict(history)), maxlen=MAX_CACHED_MESSAGES),
+            'count': len(history),
+            'owner': item.get('UserId')
+        }
+        _history_cache[session_id] = entry
         
-        logger.info(f"Loaded and cached {len(all_messages)} messages")
-        return all_messages
+        logger.info(f"Loaded and cached {len(entry['messages'])} messages")
+        return entry
         
     except Exception as e:
         logger.error(f"Failed to load conversation history: {e}", exc_info=True)
-        return []
+        _history_cache.pop(session_id, None)
+        return {'messages': deque(), 'count': 0, 'owner': None}
 
 
-def get_history_messages(session_id: str, message_count: int = 2) -> List:
+def load_history(session_id: str) -> deque:
+    """
+    Load conversation history from DynamoDB with caching.
+    
+    Args:
+        session_id: Session ID
+        
+    Returns:
+        Deque of cleaned messages (capped at MAX_CACHED_MESSAGES)
+    """
+    return _load_session(session_id)['messages']
+
+
+def get_history_messages(session_id: str, message_count: int = 2, user_id: Optional[str] = None) -> List:
     """
     Get raw message objects from history (for internal use by agent).
     
     Args:
         session_id: Session ID
         message_count: Number of messages to retrieve (default: 2 for last exchange)
+        user_id: If given, the requesting user; the session must not be owned by anyone else
         
     Returns:
         List of message objects
+        
+    Raises:
+        PermissionError: If the session's stored UserId belongs to a different user
     """
-    all_messages = load_history(session_id)
+    session = _load_session(session_id)
+    
+    # The stored owner is authoritative: a session id prefix alone can't tell
+    # user "bob" apart from a session of user "bob-smith"
+    if user_id is not None and session['owner'] not in (None, user_id):
+        raise PermissionError(f"Session {session_id} belongs to another user")
+    
+    all_messages = session['messages']
     
     if not all_messages:
         return []
     
     # Get the last N messages
-    if len(all_messages) >= message_count:
-        return all_messages[-message_count:]
-    else:
-        return all_messages
+    return tail_messages(all_messages, message_count)
 
 
 @tool
@@ -128,7 +194,7 @@ def get_conversation_history(message_count: int = 10, session_id: str = None) ->
         return "No conversation history found for this session."
     
     # Get the last N messages
-    recent_messages = all_messages[-message_count:] if len(all_messages) > message_count else all_messages
+    recent_messages = tail_messages(all_messages, message_count)
     
     # Format messages for display
     formatted = []
@@ -156,39 +222,64 @@ def get_conversation_history(message_count: int = 10, session_id: str = None) ->
     return result
 
 
-def save_messages(session_id: str, user_message: str, ai_message: str) -> None:
+def save_messages(session_id: str, user_id: str, user_message: str, ai_message: str) -> None:
     """
     Save new messages to DynamoDB chat history.
     
     Args:
         session_id: Session ID
+        user_id: Owner of the session (indexed for listing a user's sessions)
         user_message: User message content
         ai_message: AI response content
     """
     try:
         logger.info(f"Saving messages to chat history for session {session_id}")
         
-        # Initialize chat history
-        chat_history = DynamoDBChatMessageHistory(
-            table_name=CHAT_HISTORY_TABLE_NAME,
-            session_id=session_id,
-            primary_key_name='SessionId',
-            ttl=TTL_SECONDS,
-            ttl_key_name='expireAt'
-        )
-        
         # Save the user message and AI response
-        chat_history.add_messages([
+        new_messages = [
             HumanMessage(content=user_message),
             AIMessage(content=ai_message)
-        ])
+        ]
+        
+        # The agent loads history before saving, so this is normally a cache hit;
+        # its count seeds MessageCount on items written before MessageCount existed
+        cached = _history_cache.get(session_id) or _load_session(session_id)
+        
+        # Append in place rather than rewriting the whole item, and keep the
+        # list-view attributes (owner, activity time, count, preview source) current
+        now = time.time()
+        chat_history_table.update_item(
+            Key={'SessionId': session_id},
+            UpdateExpression=(
+                'SET History = list_append(if_not_exists(History, :empty), :messages), '
+                'MessageCount = if_not_exists(MessageCount, :stored_count) + :added, '
+                'LastAiMessage = :last_ai_message, UserId = :user_id, '
+                'LastUpdated = :last_updated, expireAt = :expire_at'
+            ),
+            # Never append to (or re-tag) a session another user already owns
+            ConditionExpression='attribute_not_exists(UserId) OR UserId = :user_id',
+            ExpressionAttributeValues={
+                ':empty': [],
+                ':messages': messages_to_dict(new_messages),
+                ':stored_count': cached['count'],
+                ':added': len(new_messages),
+                ':last_ai_message': ai_message[:PREVIEW_SOURCE_CHARS],
+                ':user_id': user_id,
+                ':last_updated': int(now * 1000),
+                ':expire_at': int(now) + TTL_SECONDS
+            }
+        )
         
         logger.info(f"Saved 2 messages to chat history for session {session_id}")
         
-        # Invalidate cache so next invocation loads fresh data
+        # Append to cached history so next invocation skips the DynamoDB reload.
+        # If another container saved in between, the count no longer matches the
+        # stored MessageCount and _load_session reloads on the next request
         if session_id in _history_cache:
-            del _history_cache[session_id]
-            logger.info(f"Invalidated cache for session {session_id}")
+            cached['messages'].extend(new_messages)
+            cached['count'] += len(new_messages)
+            cached['owner'] = user_id
+            logger.info(f"Updated cached history for session {session_id}")
             
     except Exception as e:
         logger.error(f"Failed to save chat history for session {session_id}: {e}", exc_info=True)
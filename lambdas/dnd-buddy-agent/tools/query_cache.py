@@ -0,0 +1,117 @@
+"""
+In-memory search result cache with exact and semantic lookup (per Lambda execution).
+
+Entries are scoped by a namespace (index, user, campaign, top_k) so cached
+results never leak between users or campaigns.
+"""
+import os
+import time
+import logging
+from typing import Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Environment variables
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '256'))
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', '300'))
+QUERY_CACHE_SIMILARITY = float(os.environ.get('QUERY_CACHE_SIMILARITY', '0.95'))
+
+# Initial number of embedding rows; capacity doubles up to max_entries
+INITIAL_CAPACITY = 16
+
+
+class QueryCache:
+    """
+    Fixed-size cache of formatted search results keyed by query text and embedding.
+
+    Embeddings live in one contiguous float32 matrix so a semantic lookup is a
+    single matrix-vector product. Slots are reused in circular order once full.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = QUERY_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = QUERY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dimension) unit embeddings
+        self._namespace_ids = np.full(max_entries, -1, dtype=np.int64)
+        self._timestamps = np.zeros(max_entries, dtype=np.float64)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._slot_keys: List[Optional[Tuple[Hashable, str]]] = [None] * max_entries
+        self._slots: Dict[Tuple[Hashable, str], int] = {}  # (namespace, query) -> slot
+        self._namespaces: Dict[Hashable, int] = {}  # namespace -> id
+        self._size = 0
+        self._next_slot = 0
+
+    def get(self, namespace: Hashable, query: str) -> Optional[str]:
+        """Return the cached response for this exact query, if still fresh."""
+        slot = self._slots.get((namespace, query))
+        if slot is None or time.time() - self._timestamps[slot] > self.ttl_seconds:
+            return None
+        return self._responses[slot]
+
+    def get_similar(self, namespace: Hashable, embedding: List[float]) -> Optional[str]:
+        """Return the cached response of the most similar query, if above the threshold."""
+        namespace_id = self._namespaces.get(namespace)
+        if namespace_id is None or not embedding or len(embedding) != self._matrix.shape[1]:
+            return None
+
+        size = self._size
+        similarities = self._matrix[:size] @ _unit_vector(embedding)
+        cutoff = time.time() - self.ttl_seconds
+        valid = (self._namespace_ids[:size] == namespace_id) & (self._timestamps[:size] >= cutoff)
+        similarities[~valid] = -np.inf
+
+        best = int(similarities.argmax())
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        logger.info(f"Semantic cache hit (similarity {similarities[best]:.3f})")
+        return self._responses[best]
+
+    def put(self, namespace: Hashable, query: str, embedding: List[float], response: str) -> None:
+        """Cache a response, overwriting the oldest slot when full."""
+        if not embedding:
+            return
+        if self._matrix is None:
+            self._matrix = np.zeros((min(INITIAL_CAPACITY, self.max_entries), len(embedding)), dtype=np.float32)
+        elif len(embedding) != self._matrix.shape[1]:
+            return
+
+        key = (namespace, query)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.max_entries
+            evicted = self._slot_keys[slot]
+            if evicted is not None:
+                del self._slots[evicted]
+            else:
+                self._size += 1
+            self._slots[key] = slot
+            self._slot_keys[slot] = key
+
+        if slot >= self._matrix.shape[0]:
+            capacity = min(self._matrix.shape[0] * 2, self.max_entries)
+            grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+
+        self._matrix[slot] = _unit_vector(embedding)
+        self._namespace_ids[slot] = self._namespaces.setdefault(namespace, len(self._namespaces))
+        self._timestamps[slot] = time.time()
+        self._responses[slot] = response
+
+
+def _unit_vector(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Shared by search_campaign and search_dnd_rules
+query_cache = QueryCache()
@@ -9,6 +9,9 @@ from langchain_core.tools import tool
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Dice notation pattern: [number]d[sides][+/-modifier]
+DICE_PATTERN = re.compile(r'^(\d*)d(\d+)([+-]\d+)?$')
+
 
 @tool
 def roll_dice(dice_notation: str) -> str:
@@ -39,8 +42,7 @@ def roll_dice(dice_notation: str) -> str:
     logger.info(f"roll_dice: {dice_notation}")
     
     # Parse dice notation
-    pattern = r'^(\d*)d(\d+)([+-]\d+)?$'
-    match = re.match(pattern, dice_notation.lower().strip())
+    match = DICE_PATTERN.match(dice_notation.lower().strip())
     
     if not match:
         logger.warning(f"Invalid dice notation: {dice_notation}")
@@ -56,12 +58,12 @@ def roll_dice(dice_notation: str) -> str:
     if die_size < 2 or die_size > 1000:
         return "Die size must be between 2 and 1000"
     
-    # Roll dice
-    rolls = [random.randint(1, die_size) for _ in range(num_dice)]
+    # Roll dice (single bulk draw instead of one randint call per die)
+    rolls = random.choices(range(1, die_size + 1), k=num_dice)
     total = sum(rolls) + modifier
     
     # Format result
-    rolls_str = ", ".join(str(r) for r in rolls)
+    rolls_str = ", ".join(map(str, rolls))
     modifier_str = f" {modifier:+d}" if modifier != 0 else ""
     
     result = f"🎲 Rolling {dice_notation}:\n"
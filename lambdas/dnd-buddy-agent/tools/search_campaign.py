@@ -1,24 +1,23 @@
 """
 Campaign search tool using S3 Vectors semantic search.
 """
-import json
 import os
 import logging
 import boto3
 from langchain_core.tools import tool
+from .embedding import client_config, embed_query
+from .query_cache import query_cache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# Initialize clients
-bedrock_runtime = boto3.client('bedrock-runtime')
-s3vectors_client = boto3.client('s3vectors')
+# Initialize client (shares the embedding client configuration)
+s3vectors_client = boto3.client('s3vectors', config=client_config)
 
 # Environment variables
 VECTOR_BUCKET = os.environ.get('VECTOR_BUCKET_NAME')
 VECTOR_INDEX = os.environ.get('VECTOR_INDEX_NAME', 'campaign-vectors-index')
-EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'cohere.embed-english-v3')
 
 
 @tool
@@ -50,20 +49,19 @@ def search_campaign(query: str, top_k: int = 5, user_id: str = None, campaign: s
     if not user_id or not campaign:
         return "Error: User context not available"
     
-    # Generate embedding for query
-    response = bedrock_runtime.invoke_model(
-        modelId=EMBEDDING_MODEL_ID,
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "texts": [query],
-            "input_type": "search_query",
-            "truncate": "END"
-        })
-    )
+    # Serve repeated or near-duplicate queries from the in-memory cache
+    cache_namespace = (VECTOR_INDEX, user_id, campaign, top_k)
+    cached = query_cache.get(cache_namespace, query)
+    if cached is not None:
+        logger.info("Returning cached results")
+        return cached
+    
+    # Generate embedding for query (shared and cached across search tools)
+    query_embedding = embed_query(query)
     
-    result = json.loads(response['body'].read())
-    query_embedding = result.get('embeddings', [[]])[0]
+    cached = query_cache.get_similar(cache_namespace, query_embedding)
+    if cached is not None:
+        return cached
     
     # Build metadata filter for user and campaign
     metadata_filter = {
@@ -88,6 +86,7 @@ def search_campaign(query: str, top_k: int = 5, user_id: str = None, campaign: s
     results = search_response.get('vectors', [])
     logger.info(f"Found {len(results)} results")
     
+    # Not cached, so a file indexed later is found by the next similar query
     if not results:
         return f"No relevant information found in the campaign for query: '{query}'"
     
@@ -101,4 +100,6 @@ def search_campaign(query: str, top_k: int = 5, user_id: str = None, campaign: s
             f"Result {i} (from {file_path}):\n{chunk_text}\n"
         )
     
-    return "\n".join(formatted_results)
+    response_text = "\n".join(formatted_results)
+    query_cache.put(cache_namespace, query, query_embedding, response_text)
+    return response_text
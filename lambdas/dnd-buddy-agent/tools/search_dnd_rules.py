@@ -1,23 +1,22 @@
 """
 D&D rules and compendium search tool using S3 Vectors semantic search.
 """
-import json
 import os
 import logging
 import boto3
 from langchain_core.tools import tool
+from .embedding import client_config, embed_query
+from .query_cache import query_cache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# Initialize clients
-bedrock_runtime = boto3.client('bedrock-runtime')
-s3vectors_client = boto3.client('s3vectors')
+# Initialize client (shares the embedding client configuration)
+s3vectors_client = boto3.client('s3vectors', config=client_config)
 
 # Environment variables
 VECTOR_BUCKET = os.environ.get('VECTOR_BUCKET_NAME')
 DND_VECTOR_INDEX = os.environ.get('DND_VECTOR_INDEX_NAME', 'dnd-vectors-index')
-EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'cohere.embed-english-v3')
 
 
 @tool
@@ -47,20 +46,19 @@ def search_dnd_rules(query: str, top_k: int = 5) -> str:
     
     logger.info(f"search_dnd_rules: query='{query}'")
     
-    # Generate embedding for query
-    response = bedrock_runtime.invoke_model(
-        modelId=EMBEDDING_MODEL_ID,
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "texts": [query],
-            "input_type": "search_query",
-            "truncate": "END"
-        })
-    )
+    # Serve repeated or near-duplicate queries from the in-memory cache
+    cache_namespace = (DND_VECTOR_INDEX, top_k)
+    cached = query_cache.get(cache_namespace, query)
+    if cached is not None:
+        logger.info("Returning cached results")
+        return cached
+    
+    # Generate embedding for query (shared and cached across search tools)
+    query_embedding = embed_query(query)
     
-    result = json.loads(response['body'].read())
-    query_embedding = result.get('embeddings', [[]])[0]
+    cached = query_cache.get_similar(cache_namespace, query_embedding)
+    if cached is not None:
+        return cached
     
     # Query vectors across all categories
     search_response = s3vectors_client.query_vectors(
@@ -76,6 +74,7 @@ def search_dnd_rules(query: str, top_k: int = 5) -> str:
     results = search_response.get('vectors', [])
     logger.info(f"Found {len(results)} results")
     
+    # Not cached, so rules indexed later are found by the next similar query
     if not results:
         return f"No D&D rules found for query: '{query}'"
     
@@ -91,4 +90,6 @@ def search_dnd_rules(query: str, top_k: int = 5) -> str:
             f"Result {i} (from {file_path}{source_info}):\n{chunk_text}\n"
         )
     
-    return "\n".join(formatted_results)
+    response_text = "\n".join(formatted_results)
+    query_cache.put(cache_namespace, query, query_embedding, response_text)
+    return response_text
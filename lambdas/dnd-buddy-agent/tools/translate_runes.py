@@ -6,6 +6,7 @@ encoded in runic script throughout the world. This tool translates between
 common tongue and The Architects' runic cipher.
 """
 import logging
+import re
 from langchain_core.tools import tool
 
 logger = logging.getLogger(__name__)
@@ -99,89 +100,46 @@ RUNE_INFO = {
 }
 
 
+# Translation tables for str.translate (single characters -> runes and back).
+# Q maps to the two-rune sequence; digraphs are substituted before translating.
+ENGLISH_TO_RUNE_TABLE = str.maketrans({
+    **LETTER_TO_RUNE,
+    **NUMBER_TO_RUNE,
+    ' ': '᛬',  # Two dots for word separator
+    '.': '᛭', ',': '᛭', '!': '᛭', '?': '᛭',  # Cross for sentence separator
+})
+
+RUNE_TO_ENGLISH_TABLE = str.maketrans({
+    **{rune: letter.lower() for rune, letter in RUNE_TO_LETTER.items() if len(rune) == 1},
+    **RUNE_TO_NUMBER,
+    **RUNE_TO_DIGRAPH,
+    '᛬': ' ',
+    '᛭': '.',
+})
+
+
+# Matches the digraphs (TH, NG) in a single left-to-right scan
+DIGRAPH_PATTERN = re.compile('|'.join(DIGRAPH_TO_RUNE))
+
+
 def english_to_runes(text: str) -> str:
     """Convert English text to Elder Futhark runes."""
-    result = []
-    text_upper = text.upper()
-    i = 0
-    
-    while i < len(text_upper):
-        char = text_upper[i]
-        
-        # Check for digraphs first (TH, NG)
-        if i + 1 < len(text_upper):
-            digraph = text_upper[i:i+2]
-            if digraph in DIGRAPH_TO_RUNE:
-                result.append(DIGRAPH_TO_RUNE[digraph])
-                i += 2
-                continue
-        
-        # Check for numbers
-        if char in NUMBER_TO_RUNE:
-            result.append(NUMBER_TO_RUNE[char])
-            i += 1
-            continue
-        
-        # Check for letters
-        if char in LETTER_TO_RUNE:
-            result.append(LETTER_TO_RUNE[char])
-            i += 1
-            continue
-        
-        # Preserve spaces and punctuation
-        if char == ' ':
-            result.append('᛬')  # Two dots for word separator
-        elif char in '.,!?':
-            result.append('᛭')  # Cross for sentence separator
-        else:
-            result.append(char)  # Keep unknown chars as-is
-        i += 1
-    
-    return ''.join(result)
+    # Digraphs first (TH, NG), then single characters; unknown chars are kept as-is
+    text_upper = DIGRAPH_PATTERN.sub(lambda match: DIGRAPH_TO_RUNE[match.group()], text.upper())
+    return text_upper.translate(ENGLISH_TO_RUNE_TABLE)
 
 
 def runes_to_english(runes: str) -> str:
     """Convert Elder Futhark runes to English text."""
-    result = []
-    i = 0
-    
-    while i < len(runes):
-        char = runes[i]
-        
-        # Check for two-character rune (Q = ᚲᚹ)
-        if i + 1 < len(runes) and runes[i:i+2] == 'ᚲᚹ':
-            result.append('Q')
-            i += 2
-            continue
-        
-        # Check digraphs
-        if char in RUNE_TO_DIGRAPH:
-            result.append(RUNE_TO_DIGRAPH[char])
-            i += 1
-            continue
-        
-        # Check numbers
-        if char in RUNE_TO_NUMBER:
-            result.append(RUNE_TO_NUMBER[char])
-            i += 1
-            continue
-        
-        # Check letters
-        if char in RUNE_TO_LETTER:
-            result.append(RUNE_TO_LETTER[char].lower())
-            i += 1
-            continue
-        
-        # Handle runic separators
-        if char == '᛬':
-            result.append(' ')
-        elif char == '᛭':
-            result.append('.')
-        else:
-            result.append(char)
-        i += 1
-    
-    return ''.join(result)
+    # Two-character rune (Q = ᚲᚹ) first, then single runes
+    return runes.replace(LETTER_TO_RUNE['Q'], 'Q').translate(RUNE_TO_ENGLISH_TABLE)
+
+
+# Direction aliases -> translation function
+DIRECTION_HANDLERS = {
+    **dict.fromkeys(("to_runes", "to_rune", "encode", "english_to_runes"), english_to_runes),
+    **dict.fromkeys(("to_english", "decode", "runes_to_english", "from_runes"), runes_to_english),
+}
 
 
 @tool
@@ -216,15 +174,12 @@ def translate_runes(text: str, direction: str = "to_runes") -> str:
     
     direction = direction.lower().strip()
     
-    if direction in ("to_runes", "to_rune", "encode", "english_to_runes"):
-        return english_to_runes(text)
-
-    elif direction in ("to_english", "decode", "runes_to_english", "from_runes"):
-        return runes_to_english(text)
+    translate = DIRECTION_HANDLERS.get(direction)
+    if translate:
+        return translate(text)
     
-    else:
-        return (
-            f"Unknown direction: {direction}\n"
-            "Use 'to_runes' to convert English to runes, "
-            "or 'to_english' to convert runes to English."
-        )
+    return (
+        f"Unknown direction: {direction}\n"
+        "Use 'to_runes' to convert English to runes, "
+        "or 'to_english' to convert runes to English."
+    )
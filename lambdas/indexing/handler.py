@@ -2,24 +2,34 @@
 Lambda handler for indexing campaign files into S3 Vectors.
 Simple implementation: read file -> chunk with overlap -> embed -> store in S3 Vectors.
 """
-import json
 import logging
 import os
 import re
-import random
 import math
-from typing import Dict, Any, List
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 import boto3
+import orjson
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Keep-alive connection pool sized for concurrent calls, with adaptive retries
+client_config = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+)
+
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-bedrock_client = boto3.client('bedrock-runtime')
-s3vectors_client = boto3.client('s3vectors')
+s3_client = boto3.client('s3', config=client_config)
+bedrock_client = boto3.client('bedrock-runtime', config=client_config)
+s3vectors_client = boto3.client('s3vectors', config=client_config)
 
 # Get environment variables
 CAMPAIGN_FILES_BUCKET = os.environ.get('CAMPAIGN_FILES_BUCKET')
@@ -29,6 +39,27 @@ BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'cohere.embed-english-v3')
 # Add environment variables at top:
 CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', '800'))
 CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', '100'))
+# Cohere on Bedrock accepts at most 96 texts per invoke_model call
+EMBEDDING_BATCH_SIZE = 96
+# S3 Vectors accepts at most 500 vectors/keys per put_vectors/delete_vectors call
+VECTOR_BATCH_SIZE = 500
+
+# CORS headers shared by every response
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'POST,OPTIONS'
+}
+
+# Sentence boundary: terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r'[.!?]\s')
+
+# Constant unit probe vector for filter-only vector queries (all zeros not allowed).
+# Its direction is irrelevant: only the metadata filter selects results.
+_DUMMY_QUERY_VECTOR = [1.0 / math.sqrt(1024)] * 1024
+
+# Shared worker pool for concurrent AWS calls (reused across warm invocations)
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
 
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict]:
     """Split text into overlapping chunks."""
@@ -47,9 +78,12 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
         # Try to break at sentence boundary
         if end < len(text):
             search_start = max(start, end - int(chunk_size * 0.2))
-            matches = list(re.finditer(r'[.!?][\s\n]', text[search_start:end]))
-            if matches:
-                end = search_start + matches[-1].end()
+            # Scan the window in place (pos/endpos) instead of slicing a copy
+            last_match = None
+            for last_match in _SENTENCE_END.finditer(text, search_start, end):
+                pass
+            if last_match:
+                end = last_match.end()
         
         chunks.append({
             'text': text[start:end],
@@ -70,79 +104,145 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     return chunks
 
 
-def generate_embedding(text: str) -> List[float]:
-    """Generate embedding using Bedrock Cohere."""
+def generate_embeddings(texts: List[str]) -> List[array]:
+    """
+    Generate embeddings for a batch of texts using Bedrock Cohere (order preserved).
+    
+    Embeddings are returned as compact float32 arrays (4 bytes per value instead
+    of a Python float object) until they are sent to S3 Vectors.
+    """
     response = bedrock_client.invoke_model(
         modelId=BEDROCK_MODEL_ID,
         contentType="application/json",
         accept="application/json",
-        body=json.dumps({
-            "texts": [text],
+        body=orjson.dumps({
+            "texts": texts,
             "input_type": "search_document",
             "truncate": "END"
         })
     )
     
-    result = json.loads(response['body'].read())
-    embeddings = result.get('embeddings', [])
+    result = orjson.loads(response['body'].read())
+    return [array('f', embedding) for embedding in result.get('embeddings', [])]
+
+
+def store_vectors(vectors: List[Dict]) -> int:
+    """Store one batch of vectors in S3 Vectors and return how many were stored."""
+    # Expand the float32 arrays to lists only for the batch being sent
+    batch = [
+        {**vector, 'data': {'float32': vector['data']['float32'].tolist()}}
+        for vector in vectors
+    ]
     
-    if embeddings and len(embeddings) > 0:
-        return embeddings[0]
+    s3vectors_client.put_vectors(
+        vectorBucketName=VECTOR_BUCKET,
+        indexName=VECTOR_INDEX,
+        vectors=batch
+    )
     
-    return None
+    logger.info(f"Stored batch of {len(batch)} vectors")
+    return len(batch)
+
 
+def vector_key_prefix(user_id: str, campaign: str, file_path: str) -> str:
+    """Build the deterministic vector key prefix shared by all chunks of a file."""
+    # Replace slashes in file_path to avoid key format issues
+    safe_file_path = file_path.replace('/', '|')
+    return f"{user_id}#{campaign}#{safe_file_path}#"
 
-def delete_existing_vectors(user_id: str, campaign: str, file_path: str) -> int:
-    """Delete all existing vectors for a given file using metadata filtering."""
+
+def get_indexed_chunk_count(s3_key: str) -> Optional[int]:
+    """
+    Read the chunk count recorded on the stored file by its previous indexing run.
+    
+    Returns 0 if the file does not exist yet, or None if the count is unknown
+    (file indexed before the count was recorded, or the lookup failed).
+    """
     try:
-        # Use QueryVectors with metadata filter to find all vectors for this file
-        # Create a random unit vector (all zeros not allowed)
+        response = s3_client.head_object(Bucket=CAMPAIGN_FILES_BUCKET, Key=s3_key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return 0
+        logger.warning(f"Error reading metadata for {s3_key}: {str(e)}")
+        return None
+    
+    # S3 returns user metadata keys in lowercase
+    total_chunks = response.get('Metadata', {}).get('totalchunks')
+    return int(total_chunks) if total_chunks is not None else None
+
+
+def scan_delete_vectors(user_id: str, campaign: str, file_path: str) -> int:
+    """Delete all vectors for a file by repeatedly querying with a metadata filter."""
+    # Use QueryVectors with metadata filter to find all vectors for this file
+    deleted_count = 0
+    
+    # Query in batches to find all matching vectors
+    while True:
+        query_params = {
+            'vectorBucketName': VECTOR_BUCKET,
+            'indexName': VECTOR_INDEX,
+            'queryVector': {'float32': _DUMMY_QUERY_VECTOR},
+            'topK': 30,  # Maximum allowed
+            'returnMetadata': False,
+            'returnDistance': False,
+            'filter': {
+                '$and': [
+                    {'userId': user_id},
+                    {'campaign': campaign},
+                    {'filePath': file_path}
+                ]
+            }
+        }
         
-        dummy_vector = [random.random() for _ in range(1024)]
-        norm = math.sqrt(sum(x * x for x in dummy_vector))
-        dummy_vector = [x / norm for x in dummy_vector]
+        response = s3vectors_client.query_vectors(**query_params)
+        vectors = response.get('vectors', [])
         
-        deleted_count = 0
+        if not vectors:
+            break
         
-        # Query in batches to find all matching vectors
-        while True:
-            query_params = {
-                'vectorBucketName': VECTOR_BUCKET,
-                'indexName': VECTOR_INDEX,
-                'queryVector': {'float32': dummy_vector},
-                'topK': 30,  # Maximum allowed
-                'returnMetadata': False,
-                'returnDistance': False,
-                'filter': {
-                    '$and': [
-                        {'userId': user_id},
-                        {'campaign': campaign},
-                        {'filePath': file_path}
-                    ]
-                }
-            }
-            
-            response = s3vectors_client.query_vectors(**query_params)
-            vectors = response.get('vectors', [])
-            
-            if not vectors:
-                break
-            
-            # Extract keys and delete
-            keys_to_delete = [v['key'] for v in vectors]
+        # Extract keys and delete
+        keys_to_delete = [v['key'] for v in vectors]
+        
+        if keys_to_delete:
+            s3vectors_client.delete_vectors(
+                vectorBucketName=VECTOR_BUCKET,
+                indexName=VECTOR_INDEX,
+                keys=keys_to_delete
+            )
+            deleted_count += len(keys_to_delete)
+            logger.info(f"Deleted {len(keys_to_delete)} vectors")
+        
+        # If we got fewer than 30 results, we're done
+        if len(vectors) < 30:
+            break
+    
+    return deleted_count
+
+
+def delete_existing_vectors(user_id: str, campaign: str, file_path: str, previous_chunks: Optional[int]) -> Optional[int]:
+    """
+    Delete all existing vectors for a given file.
+    
+    Vector keys are deterministic, so when the previous chunk count is known the
+    keys are deleted directly; otherwise fall back to a metadata-filtered scan.
+    
+    Returns the number of vectors deleted, or None if the deletion failed.
+    """
+    try:
+        if previous_chunks is None:
+            logger.info(f"Previous chunk count unknown for {file_path}, scanning for vectors")
+            deleted_count = scan_delete_vectors(user_id, campaign, file_path)
+        else:
+            key_prefix = vector_key_prefix(user_id, campaign, file_path)
+            keys_to_delete = [f"{key_prefix}{i}" for i in range(previous_chunks)]
             
-            if keys_to_delete:
+            for i in range(0, len(keys_to_delete), VECTOR_BATCH_SIZE):
                 s3vectors_client.delete_vectors(
                     vectorBucketName=VECTOR_BUCKET,
                     indexName=VECTOR_INDEX,
-                    keys=keys_to_delete
+                    keys=keys_to_delete[i:i + VECTOR_BATCH_SIZE]
                 )
-                deleted_count += len(keys_to_delete)
-                logger.info(f"Deleted {len(keys_to_delete)} vectors")
-            
-            # If we got fewer than 30 results, we're done
-            if len(vectors) < 30:
-                break
+            deleted_count = len(keys_to_delete)
         
         logger.info(f"Total vectors deleted: {deleted_count}")
         return deleted_count
@@ -150,26 +250,22 @@ def delete_existing_vectors(user_id: str, campaign: str, file_path: str) -> int:
     except Exception as e:
         logger.warning(f"Error deleting existing vectors: {str(e)}")
         # Don't fail the whole operation if deletion fails
-        return 0
+        return None
 
 
 def index_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Save and index campaign file: save to S3 -> chunk -> embed -> store in S3 Vectors."""
-    logger.info(f"Save and index request: {json.dumps(event)}")
+    logger.info(f"Save and index request: {orjson.dumps(event).decode()}")
     
     # Parse body if it's a string (from API Gateway)
     if isinstance(event.get('body'), str):
         try:
-            body = json.loads(event['body'])
-        except json.JSONDecodeError:
+            body = orjson.loads(event['body'])
+        except orjson.JSONDecodeError:
             return {
                 'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-                    'Access-Control-Allow-Methods': 'POST,OPTIONS'
-                },
-                'body': json.dumps({'error': 'Invalid JSON in request body'})
+                'headers': CORS_HEADERS,
+                'body': orjson.dumps({'error': 'Invalid JSON in request body'}).decode()
             }
     else:
         body = event
@@ -184,63 +280,76 @@ def index_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     logger.info(f"User ID from Cognito: {user_id}")
     
-    cors_headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'POST,OPTIONS'
-    }
-    
     if not all([user_id, campaign, file_path, file_content]):
         return {
             'statusCode': 400,
-            'headers': cors_headers,
-            'body': json.dumps({'error': 'Missing required parameters: userId, campaign, filePath, content'})
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({'error': 'Missing required parameters: userId, campaign, filePath, content'}).decode()
         }
     
     try:
-        # 0. Delete existing vectors for this file
-        deleted_count = delete_existing_vectors(user_id, campaign, file_path)
-        logger.info(f"Deleted {deleted_count} existing vectors for {file_path}")
+        s3_key = f"{user_id}/{campaign}/{file_path}"
+        
+        # 0. Delete existing vectors for this file in the background
+        # (the count must be read before the file below is overwritten)
+        previous_chunks = get_indexed_chunk_count(s3_key)
+        delete_future = _EXECUTOR.submit(delete_existing_vectors, user_id, campaign, file_path, previous_chunks)
         original_text = file_content
-        logger.info(f"Processing {len(original_text)} characters")
+        # Encode once; the same bytes are uploaded to S3
+        original_bytes = original_text.encode('utf-8')
+        logger.info(f"Processing {len(original_text)} characters ({len(original_bytes)} bytes)")
         
-        # 1. Save file to campaign files bucket (overwrites existing)
-        s3_key = f"{user_id}/{campaign}/{file_path}"
-        logger.info(f"Saving file to s3://{CAMPAIGN_FILES_BUCKET}/{s3_key}")
+        # 1. Chunk text with overlap
+        chunks = chunk_text(original_text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        logger.info(f"Created {len(chunks)} chunks")
         
-        s3_client.put_object(
-            Bucket=CAMPAIGN_FILES_BUCKET,
-            Key=s3_key,
-            Body=original_text.encode('utf-8'),
-            ContentType='text/markdown',
-            Metadata={
+        # 2. Save file to campaign files bucket (overwrites existing) in the background,
+        # overlapping the embedding below and kept even if indexing fails. totalChunks
+        # lets the next indexing run delete vectors by key, so it covers both this
+        # run's keys and the old ones in case the delete below fails
+        put_kwargs = {
+            'Bucket': CAMPAIGN_FILES_BUCKET,
+            'Key': s3_key,
+            'Body': original_bytes,
+            'ContentType': 'text/markdown',
+            'Metadata': {
                 'userId': user_id,
                 'campaign': campaign,
                 'filePath': file_path,
                 'lastModified': datetime.utcnow().isoformat() + 'Z'
             }
-        )
-        logger.info(f"File saved successfully")
-        
-        # 2. Chunk text with overlap
-        chunks = chunk_text(original_text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        logger.info(f"Created {len(chunks)} chunks")
+        }
+        put_future = None
+        if previous_chunks is not None:
+            put_kwargs['Metadata']['totalChunks'] = str(max(previous_chunks, len(chunks)))
+            logger.info(f"Saving file to s3://{CAMPAIGN_FILES_BUCKET}/{s3_key}")
+            put_future = _EXECUTOR.submit(s3_client.put_object, **put_kwargs)
         
         # 3. Generate embeddings and prepare vectors for batch insert
         indexed_at = datetime.utcnow().isoformat() + 'Z'
         vectors_to_insert = []
         
-        for chunk in chunks:
-            # Generate embedding
-            embedding = generate_embedding(chunk['text'])
+        key_prefix = vector_key_prefix(user_id, campaign, file_path)
+        
+        # Embed batches concurrently; map() keeps results in chunk order
+        batches = [
+            [chunk['text'] for chunk in chunks[i:i + EMBEDDING_BATCH_SIZE]]
+            for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+        ]
+        embeddings = []
+        for batch_embeddings in _EXECUTOR.map(generate_embeddings, batches):
+            embeddings.extend(batch_embeddings)
+        logger.info(f"Generated {len(embeddings)} embeddings")
+        if len(embeddings) != len(chunks):
+            logger.error(f"Expected {len(chunks)} embeddings, got {len(embeddings)}")
+        
+        for chunk, embedding in zip(chunks, embeddings):
             if not embedding:
                 logger.error(f"Failed to generate embedding for chunk {chunk['chunkIndex']}")
                 continue
             
             # Prepare vector for batch insert
-            # Replace slashes in file_path to avoid key format issues
-            safe_file_path = file_path.replace('/', '|')
-            vector_key = f"{user_id}#{campaign}#{safe_file_path}#{chunk['chunkIndex']}"
+            vector_key = f"{key_prefix}{chunk['chunkIndex']}"
             
             vectors_to_insert.append({
                 'key': vector_key,
@@ -258,45 +367,47 @@ def index_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             })
         
-        # 4. Store all vectors in S3 Vectors (batch up to 500 at a time)
-        chunks_stored = 0
-        batch_size = 500
+        # Old vectors share keys with the new ones, so deletion must finish first
+        deleted_count = delete_future.result()
+        logger.info(f"Deleted {deleted_count} existing vectors for {file_path}")
         
-        for i in range(0, len(vectors_to_insert), batch_size):
-            batch = vectors_to_insert[i:i + batch_size]
-            
-            s3vectors_client.put_vectors(
-                vectorBucketName=VECTOR_BUCKET,
-                indexName=VECTOR_INDEX,
-                vectors=batch
-            )
-            
-            chunks_stored += len(batch)
-            logger.info(f"Stored batch: {chunks_stored}/{len(vectors_to_insert)} vectors")
+        # Without a stored count the old keys are unknown (they were found by a
+        # scan), so the file is saved afterwards with totalChunks unset and the
+        # next run scans as well
+        if put_future is None:
+            logger.info(f"Saving file to s3://{CAMPAIGN_FILES_BUCKET}/{s3_key}")
+            put_future = _EXECUTOR.submit(s3_client.put_object, **put_kwargs)
+        
+        # 4. Store all vectors in S3 Vectors (batches of up to 500, sent concurrently)
+        vector_batches = [
+            vectors_to_insert[i:i + VECTOR_BATCH_SIZE]
+            for i in range(0, len(vectors_to_insert), VECTOR_BATCH_SIZE)
+        ]
+        chunks_stored = sum(_EXECUTOR.map(store_vectors, vector_batches))
         
         logger.info(f"Successfully indexed {chunks_stored} chunks")
         
+        # Raises if the upload failed, turning the request into a 500
+        put_future.result()
+        logger.info(f"File saved successfully")
+        
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS'
-            },
-            'body': json.dumps({
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({
                 'message': 'File indexed successfully',
                 'chunksProcessed': chunks_stored,
-                'chunksDeleted': deleted_count,
+                'chunksDeleted': deleted_count or 0,
                 'userId': user_id,
                 'campaign': campaign,
                 'filePath': file_path
-            })
+            }).decode()
         }
         
     except Exception as e:
         logger.error(f"Error: {str(e)}", exc_info=True)
         return {
             'statusCode': 500,
-            'headers': cors_headers,
-            'body': json.dumps({'error': str(e)})
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
@@ -2,33 +2,86 @@
 Lambda handler for session management.
 Provides endpoints to list user sessions and retrieve session history.
 """
-import json
+import base64
+import binascii
 import logging
 import os
+from functools import lru_cache
 import boto3
-from typing import Dict, Any, List
+import orjson
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-from decimal import Decimal
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
+# Initialize DynamoDB client (low-level: items come back as DynamoDB JSON and
+# are unwrapped in one pass, without the resource layer's Decimal conversion)
+dynamodb = boto3.client('dynamodb')
 CHAT_HISTORY_TABLE_NAME = os.environ.get('CHAT_HISTORY_TABLE_NAME', 'dnd-buddy-chat-history')
+# GSI keyed on UserId (hash) and LastUpdated (range)
+CHAT_HISTORY_USER_INDEX = os.environ.get('CHAT_HISTORY_USER_INDEX', 'UserIdIndex')
 
+# Largest session list page, also used when a request gives no ?limit=
+MAX_PAGE_SIZE = 100
 
-# Custom JSON encoder to handle Decimal types from DynamoDB
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            # Convert Decimal to int if it's a whole number, otherwise to float
-            if obj % 1 == 0:
-                return int(obj)
-            else:
-                return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+# Returned when a session id does not belong to the requesting user
+INVALID_SESSION_ERROR = {
+    'error': 'Invalid session: session does not belong to the authenticated user',
+    'code': 'validation_error'
+}
+
+# Shared read-only default for missing mappings
+EMPTY: Dict[str, Any] = {}
+
+
+def unwrap(value: Dict[str, Any]) -> Any:
+    """Convert a DynamoDB JSON attribute value ({'S': ...}, {'N': ...}, ...) to plain Python."""
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        number = value['N']
+        return float(number) if '.' in number or 'e' in number or 'E' in number else int(number)
+    if 'M' in value:
+        return {key: unwrap(item) for key, item in value['M'].items()}
+    if 'L' in value:
+        return [unwrap(item) for item in value['L']]
+    if 'BOOL' in value:
+        return value['BOOL']
+    if 'NULL' in value:
+        return None
+    if 'SS' in value:
+        return value['SS']
+    if 'NS' in value:
+        return [unwrap({'N': number}) for number in value['NS']]
+    raise ValueError(f"Unsupported DynamoDB attribute value: {list(value)}")
+
+
+def unwrap_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a DynamoDB JSON item to a plain dictionary."""
+    return {key: unwrap(value) for key, value in item.items()}
+
+
+def to_json(obj: Any) -> str:
+    """Serialize a response body."""
+    return orjson.dumps(obj).decode()
+
+
+# Response headers shared by every response
+CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'GET,OPTIONS'
+}
+
+# Prebuilt response for requests without a Cognito username
+UNAUTHORIZED_RESPONSE = {
+    'statusCode': 401,
+    'headers': CORS_HEADERS,
+    'body': to_json({'error': 'Unauthorized: No user ID found'})
+}
 
 
 def lambda_handler(event, context):
@@ -36,59 +89,42 @@ def lambda_handler(event, context):
     Lambda handler for session management.
     
     Routes:
-    - GET /sessions - List all sessions for the authenticated user
+    - GET /sessions - List sessions for the authenticated user (?limit=&nextToken= to page)
     - GET /sessions/{sessionId} - Get history for a specific session
     """
-    logger.info(f"Session request: {json.dumps(event)}")
-    
-    cors_headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'GET,OPTIONS'
-    }
+    # Only the routing fields (never claims or headers), formatted lazily
+    logger.debug("Session request: %s %s %s", event.get('httpMethod'), event.get('path'), event.get('pathParameters'))
     
     try:
         # Extract userId from Cognito authorizer claims
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('cognito:username')
+        user_id = event.get('requestContext', EMPTY).get('authorizer', EMPTY).get('claims', EMPTY).get('cognito:username')
         
         if not user_id:
-            return {
-                'statusCode': 401,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Unauthorized: No user ID found'})
-            }
-        
-        # Determine the operation based on path parameters
-        path_parameters = event.get('pathParameters') or {}
-        session_id = path_parameters.get('sessionId')
+            return UNAUTHORIZED_RESPONSE
         
-        if session_id:
-            # Get specific session history
-            result = get_session_history(user_id, session_id)
-        else:
-            # List all sessions for user
-            result = list_user_sessions(user_id)
+        # Route on whether a sessionId path parameter is present
+        session_id = (event.get('pathParameters') or EMPTY).get('sessionId')
+        result = ROUTES[bool(session_id)](user_id, session_id, event.get('queryStringParameters') or EMPTY)
         
         if 'error' in result:
             return {
                 'statusCode': 400 if result.get('code') == 'validation_error' else 500,
-                'headers': cors_headers,
-                'body': json.dumps({'error': result['error']}, cls=DecimalEncoder)
+                'headers': CORS_HEADERS,
+                'body': to_json({'error': result['error']})
             }
         
         return {
             'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps(result, cls=DecimalEncoder)
+            'headers': CORS_HEADERS,
+            'body': to_json(result)
         }
         
     except Exception as e:
         logger.error(f"Lambda error: {str(e)}", exc_info=True)
         return {
             'statusCode': 500,
-            'headers': cors_headers,
-            'body': json.dumps({'error': str(e)}, cls=DecimalEncoder)
+            'headers': CORS_HEADERS,
+            'body': to_json({'error': str(e)})
         }
 
 
@@ -99,106 +135,127 @@ def extract_preview(content: str, min_chars: int = 150, max_chars: int = 500) ->
     if not content:
         return ''
     
-    # Split on double newlines to get paragraphs
-    paragraphs = content.split('\n\n')
-    first_para = paragraphs[0].strip()
+    # Scan for paragraph breaks (double newlines) only as far as needed
+    end = content.find('\n\n')
+    preview = (content if end < 0 else content[:end]).strip()
     
     # If first paragraph is too short and there are more, include more
-    if len(first_para) < min_chars and len(paragraphs) > 1:
-        preview = first_para
-        for para in paragraphs[1:]:
-            preview += '\n\n' + para.strip()
-            if len(preview) >= min_chars:
-                break
-        first_para = preview
+    if len(preview) < min_chars and end >= 0:
+        paragraphs = [preview]
+        length = len(preview)
+        while length < min_chars and end >= 0:
+            start = end + 2
+            end = content.find('\n\n', start)
+            para = (content[start:] if end < 0 else content[start:end]).strip()
+            paragraphs.append(para)
+            length += 2 + len(para)
+        preview = '\n\n'.join(paragraphs)
     
-    # Truncate if too long
-    if len(first_para) > max_chars:
-        first_para = first_para[:max_chars].rsplit(' ', 1)[0] + '...'
+    # Truncate if too long, at the last space before the limit
+    if len(preview) > max_chars:
+        cut = preview.rfind(' ', 0, max_chars)
+        preview = preview[:cut if cut >= 0 else max_chars] + '...'
     
-    return first_para
+    return preview
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(millis: int) -> str:
+    """Format an epoch-milliseconds timestamp as ISO 8601."""
+    return datetime.fromtimestamp(millis / 1000).isoformat()
 
 
-def list_user_sessions(user_id: str) -> Dict[str, Any]:
+def encode_page_token(last_evaluated_key: Dict[str, Any]) -> str:
+    """Encode a DynamoDB LastEvaluatedKey (DynamoDB JSON) as an opaque page token."""
+    return base64.urlsafe_b64encode(orjson.dumps(last_evaluated_key)).decode()
+
+
+def decode_page_token(token: str) -> Dict[str, Any]:
+    """Decode a page token back into an ExclusiveStartKey (raises ValueError if malformed)."""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid nextToken: {e}")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid nextToken")
+    return key
+
+
+def query_user_sessions(user_id: str, limit: int, start_key: Optional[Dict[str, Any]]):
+    """
+    Query up to limit session items for a user from the GSI, following
+    pages only until the limit is reached.
+    
+    Returns:
+        Tuple of (items, last_evaluated_key or None)
     """
-    List all sessions for a user, sorted by most recent first.
+    items = []
+    query_kwargs = {
+        'TableName': CHAT_HISTORY_TABLE_NAME,
+        'IndexName': CHAT_HISTORY_USER_INDEX,
+        'KeyConditionExpression': 'UserId = :user_id',
+        'ExpressionAttributeValues': {':user_id': {'S': user_id}},
+        'ScanIndexForward': False,
+        # Only the list-view attributes are fetched, never the full History
+        'ProjectionExpression': 'SessionId, LastUpdated, MessageCount, LastAiMessage'
+    }
+    
+    while True:
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = dynamodb.query(Limit=limit - len(items), **query_kwargs)
+        items.extend(unwrap_item(item) for item in response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key or len(items) >= limit:
+            return items, start_key
+
+
+def list_user_sessions(user_id: str, limit: Optional[str] = None, next_token: Optional[str] = None) -> Dict[str, Any]:
+    """
+    List a page of sessions for a user, most recently updated first.
     
     Args:
         user_id: The Cognito username
+        limit: Maximum number of sessions to return (default and cap MAX_PAGE_SIZE)
+        next_token: Token from a previous page to continue from
         
     Returns:
-        Dictionary with sessions list
+        Dictionary with sessions list and nextToken (if more sessions remain)
     """
     try:
-        table = dynamodb.Table(CHAT_HISTORY_TABLE_NAME)
+        try:
+            page_size = min(int(limit), MAX_PAGE_SIZE) if limit else MAX_PAGE_SIZE
+            if page_size < 1:
+                raise ValueError("limit must be positive")
+            start_key = decode_page_token(next_token) if next_token else None
+        except ValueError as e:
+            return {'error': str(e), 'code': 'validation_error'}
         
-        # Scan the table for sessions that start with user_id
-        # Note: In production, consider using a GSI for better performance
-        response = table.scan(
-            FilterExpression='begins_with(SessionId, :user_prefix)',
-            ExpressionAttributeValues={
-                ':user_prefix': f"{user_id}-"
-            }
-        )
+        # Query the user's sessions from the GSI, most recently updated first
+        items, last_evaluated_key = query_user_sessions(user_id, page_size, start_key)
         
         sessions = []
-        for item in response.get('Items', []):
+        for item in items:
             session_id = item.get('SessionId')
-            history = item.get('History', [])
-            
-            # Extract timestamp from session_id (format: username-timestamp-random)
-            try:
-                parts = session_id.split('-')
-                if len(parts) >= 2:
-                    timestamp = int(parts[1])
-                    last_updated = datetime.fromtimestamp(timestamp / 1000).isoformat()
-                else:
-                    last_updated = None
-            except (ValueError, IndexError):
-                last_updated = None
-            
-            # Get last agent message as preview (first paragraph, 150-500 chars)
-            preview = None
-            if history:
-                # Find the last agent (ai) message for preview
-                for msg in reversed(history):
-                    if msg.get('type') == 'ai':
-                        content = msg.get('data', {}).get('content', '')
-                        
-                        # Handle content as either string or list
-                        if isinstance(content, list):
-                            content_str = ' '.join(str(item) for item in content) if content else ''
-                        else:
-                            content_str = str(content)
-                        
-                        preview = extract_preview(content_str)
-                        break
-                
-                # Fallback to last message if no agent message found
-                if preview is None:
-                    last_msg = history[-1]
-                    content = last_msg.get('data', {}).get('content', '')
-                    if isinstance(content, list):
-                        content_str = ' '.join(str(item) for item in content) if content else ''
-                    else:
-                        content_str = str(content)
-                    preview = extract_preview(content_str)
+            last_updated = item.get('LastUpdated')
+            if last_updated is not None:
+                last_updated = format_timestamp(last_updated)
             
+            # Every indexed item carries the list-view attributes (written by the
+            # agent, or by scripts/backfill_session_index.py for older sessions)
             sessions.append({
                 'sessionId': session_id,
                 'lastUpdated': last_updated,
-                'messageCount': len(history),
-                'preview': preview or 'No messages'
+                'messageCount': item.get('MessageCount', 0),
+                'preview': extract_preview(item.get('LastAiMessage', '')) or 'No messages'
             })
         
-        # Sort by timestamp (most recent first)
-        sessions.sort(key=lambda x: x.get('lastUpdated') or '', reverse=True)
-        
         logger.info(f"Found {len(sessions)} sessions for user {user_id}")
         
         return {
             'sessions': sessions,
-            'count': len(sessions)
+            'count': len(sessions),
+            'nextToken': encode_page_token(last_evaluated_key) if last_evaluated_key else None
         }
         
     except Exception as e:
@@ -206,6 +263,12 @@ def list_user_sessions(user_id: str) -> Dict[str, Any]:
         return {'error': f"Failed to list sessions: {str(e)}"}
 
 
+def has_owner_prefix(user_id: str, session_id: str) -> bool:
+    """Check that session_id has the form '<user_id>-...'."""
+    prefix_length = len(user_id)
+    return session_id.startswith(user_id) and session_id[prefix_length:prefix_length + 1] == '-'
+
+
 def get_session_history(user_id: str, session_id: str) -> Dict[str, Any]:
     """
     Get the full message history for a specific session.
@@ -218,19 +281,15 @@ def get_session_history(user_id: str, session_id: str) -> Dict[str, Any]:
         Dictionary with session history
     """
     try:
-        # Validate that session belongs to user
-        if not session_id.startswith(f"{user_id}-"):
+        # Validate that session belongs to user (cheap check before any read)
+        if not has_owner_prefix(user_id, session_id):
             logger.warning(f"User {user_id} attempted to access session {session_id}")
-            return {
-                'error': 'Invalid session: session does not belong to the authenticated user',
-                'code': 'validation_error'
-            }
-        
-        table = dynamodb.Table(CHAT_HISTORY_TABLE_NAME)
+            return INVALID_SESSION_ERROR
         
         # Get the session item
-        response = table.get_item(
-            Key={'SessionId': session_id}
+        response = dynamodb.get_item(
+            TableName=CHAT_HISTORY_TABLE_NAME,
+            Key={'SessionId': {'S': session_id}}
         )
         
         if 'Item' not in response:
@@ -239,21 +298,26 @@ def get_session_history(user_id: str, session_id: str) -> Dict[str, Any]:
                 'code': 'validation_error'
             }
         
-        item = response['Item']
+        item = unwrap_item(response['Item'])
+        
+        # The stored owner is authoritative: a prefix alone can't tell user "bob"
+        # apart from a session of user "bob-smith"
+        owner = item.get('UserId')
+        if owner is not None and owner != user_id:
+            logger.warning(f"User {user_id} attempted to access session {session_id} owned by {owner}")
+            return INVALID_SESSION_ERROR
         history = item.get('History', [])
         
         # Format messages for frontend consumption
-        messages = []
-        for msg in history:
-            msg_type = msg.get('type')
-            msg_data = msg.get('data', {})
-            
-            messages.append({
-                'type': msg_type,
-                'content': msg_data.get('content', ''),
+        messages = [
+            {
+                'type': msg.get('type'),
+                'content': (msg_data := msg.get('data') or EMPTY).get('content', ''),
                 'timestamp': msg_data.get('timestamp'),
-                'additionalKwargs': msg_data.get('additional_kwargs', {})
-            })
+                'additionalKwargs': msg_data.get('additional_kwargs', EMPTY)
+            }
+            for msg in history
+        ]
         
         logger.info(f"Retrieved {len(messages)} messages for session {session_id}")
         
@@ -266,3 +330,24 @@ def get_session_history(user_id: str, session_id: str) -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"Failed to get session history for {session_id}: {e}", exc_info=True)
         return {'error': f"Failed to retrieve session history: {str(e)}"}
+
+
+def route_get_session(user_id: str, session_id: str, query_parameters: Dict[str, str]) -> Dict[str, Any]:
+    """GET /sessions/{sessionId}"""
+    return get_session_history(user_id, session_id)
+
+
+def route_list_sessions(user_id: str, session_id: Optional[str], query_parameters: Dict[str, str]) -> Dict[str, Any]:
+    """GET /sessions (one page at a time)"""
+    return list_user_sessions(
+        user_id,
+        limit=query_parameters.get('limit'),
+        next_token=query_parameters.get('nextToken')
+    )
+
+
+# Route table keyed on whether the request names a session
+ROUTES = {
+    True: route_get_session,
+    False: route_list_sessions,
+}
@@ -30,12 +30,20 @@ export class ApiStack extends cdk.Stack {
       removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
 
-    // Indexing Lambda function (boto3 is included in runtime, no layer needed)
+    // Indexing Lambda function (dependencies from requirements.txt are bundled)
     const indexingLambda = new lambda.Function(this, 'IndexingLambda', {
       functionName: 'dnd-buddy-indexing',
       runtime: lambda.Runtime.PYTHON_3_11,
       handler: 'handler.index_handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambdas/indexing')),
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambdas/indexing'), {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'
+          ],
+        },
+      }),
       timeout: cdk.Duration.minutes(5),
       memorySize: 128,
       logGroup: indexingLogGroup,
@@ -80,12 +88,20 @@ export class ApiStack extends cdk.Stack {
       removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
 
-    // Sessions Lambda for managing chat history
+    // Sessions Lambda for managing chat history (dependencies from requirements.txt are bundled)
     const sessionsLambda = new lambda.Function(this, 'SessionsLambda', {
       functionName: 'dnd-buddy-sessions',
       runtime: lambda.Runtime.PYTHON_3_11,
       handler: 'handler.lambda_handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambdas/sessions')),
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambdas/sessions'), {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'
+          ],
+        },
+      }),
       timeout: cdk.Duration.seconds(30),
       memorySize: 256,
       logGroup: sessionsLogGroup,
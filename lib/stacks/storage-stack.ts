@@ -43,6 +43,16 @@ export class StorageStack extends cdk.Stack {
       removalPolicy: cdk.RemovalPolicy.DESTROY
     });
 
+    // Add GSI for listing a user's sessions, most recently updated first
+    this.chatHistoryTable.addGlobalSecondaryIndex({
+      indexName: 'UserIdIndex',
+      partitionKey: { name: 'UserId', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'LastUpdated', type: dynamodb.AttributeType.NUMBER },
+      // Only the list-view attributes; full History stays on the base table
+      projectionType: dynamodb.ProjectionType.INCLUDE,
+      nonKeyAttributes: ['MessageCount', 'LastAiMessage'],
+    });
+
     // DynamoDB table for WebSocket connections
     this.websocketConnectionTable = new dynamodb.Table(this, 'WebSocketConnectionTable', {
       tableName: 'dnd-buddy-websocket-connections',
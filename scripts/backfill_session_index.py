@@ -0,0 +1,154 @@
+"""
+One-off backfill of the session list attributes on chat history items.
+
+Items written before the UserIdIndex GSI existed have no UserId, so the sparse
+index leaves them out of GET /sessions. This sets UserId, LastUpdated,
+MessageCount and LastAiMessage on every item that still lacks UserId.
+
+Usage:
+    python scripts/backfill_session_index.py --user-pool-id <DndBuddy-UserPoolId> [--dry-run]
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+CHAT_HISTORY_TABLE_NAME = os.environ.get('CHAT_HISTORY_TABLE_NAME', 'dnd-buddy-chat-history')
+
+# Must match lambdas/dnd-buddy-agent/tools/get_history.py
+TTL_SECONDS = 7 * 24 * 60 * 60
+PREVIEW_SOURCE_CHARS = 2000
+
+
+def make_user_lookup(user_pool_id: str) -> Callable[[str], bool]:
+    """Return a memoized check for whether a Cognito username exists."""
+    cognito = boto3.client('cognito-idp')
+    known = {}
+
+    def user_exists(username: str) -> bool:
+        if username not in known:
+            try:
+                cognito.admin_get_user(UserPoolId=user_pool_id, Username=username)
+                known[username] = True
+            except cognito.exceptions.UserNotFoundException:
+                known[username] = False
+        return known[username]
+
+    return user_exists
+
+
+def resolve_owner(session_id: str, user_exists: Callable[[str], bool]) -> Optional[str]:
+    """
+    Find the owner of a session id of the form '<user>-...'.
+
+    Usernames may contain '-', so the owner is the longest '-'-delimited
+    prefix that is an existing user.
+    """
+    parts = session_id.split('-')
+    for end in range(len(parts) - 1, 0, -1):
+        candidate = '-'.join(parts[:end])
+        if user_exists(candidate):
+            return candidate
+    return None
+
+
+def last_updated_millis(session_id: str, owner: str, item: Dict[str, Any]) -> int:
+    """Best estimate of the session's last activity, in epoch milliseconds."""
+    # Session ids are '<user>-<epoch millis>-<suffix>' or '<user>-<campaign>-default'
+    segment = session_id[len(owner) + 1:].split('-', 1)[0]
+    if segment.isdigit() and len(segment) >= 12:
+        return int(segment)
+
+    # expireAt was set to the last write time plus the TTL
+    if 'expireAt' in item:
+        return (int(item['expireAt']) - TTL_SECONDS) * 1000
+
+    return int(time.time() * 1000)
+
+
+def preview_source(history: List[Dict[str, Any]]) -> str:
+    """Leading text of the last agent (ai) message, or of the last message if there is none."""
+    if not history:
+        return ''
+
+    message = next((msg for msg in reversed(history) if msg.get('type') == 'ai'), history[-1])
+    content = (message.get('data') or {}).get('content', '')
+    if type(content) is not str:
+        content = ' '.join(map(str, content)) if isinstance(content, list) else str(content)
+    return content[:PREVIEW_SOURCE_CHARS]
+
+
+def backfill(table, user_exists: Callable[[str], bool], dry_run: bool) -> Dict[str, int]:
+    """Scan for items without UserId and set the session list attributes on them."""
+    counts = {'updated': 0, 'skipped': 0}
+    scan_kwargs = {
+        'FilterExpression': Attr('UserId').not_exists(),
+        'ProjectionExpression': 'SessionId, History, expireAt'
+    }
+
+    while True:
+        response = table.scan(**scan_kwargs)
+
+        for item in response.get('Items', []):
+            session_id = item['SessionId']
+            owner = resolve_owner(session_id, user_exists)
+            if owner is None:
+                logger.warning(f"No existing user owns session {session_id}, skipping")
+                counts['skipped'] += 1
+                continue
+
+            history = item.get('History', [])
+            values = {
+                ':user_id': owner,
+                ':last_updated': last_updated_millis(session_id, owner, item),
+                ':message_count': len(history),
+                ':last_ai_message': preview_source(history)
+            }
+
+            if dry_run:
+                logger.info(f"Would set {session_id}: UserId={owner}, LastUpdated={values[':last_updated']}, MessageCount={len(history)}")
+                counts['updated'] += 1
+                continue
+
+            try:
+                table.update_item(
+                    Key={'SessionId': session_id},
+                    UpdateExpression=(
+                        'SET UserId = :user_id, LastUpdated = :last_updated, '
+                        'MessageCount = :message_count, LastAiMessage = :last_ai_message'
+                    ),
+                    # The agent may have written the session since the scan read it
+                    ConditionExpression='attribute_not_exists(UserId)',
+                    ExpressionAttributeValues=values
+                )
+                counts['updated'] += 1
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                counts['skipped'] += 1
+
+        if 'LastEvaluatedKey' not in response:
+            return counts
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-pool-id', required=True, help='Cognito user pool used to resolve session owners')
+    parser.add_argument('--dry-run', action='store_true', help='Report the changes without writing them')
+    args = parser.parse_args()
+
+    table = boto3.resource('dynamodb').Table(CHAT_HISTORY_TABLE_NAME)
+    counts = backfill(table, make_user_lookup(args.user_pool_id), args.dry_run)
+    logger.info(f"Done: {counts['updated']} updated, {counts['skipped']} skipped")
+
+
+if __name__ == '__main__':
+    main()